@@ -1,39 +1,113 @@
 import unittest
-from unittest.mock import patch, mock_open, MagicMock
+from unittest.mock import patch
+import io
+import xml.etree.ElementTree as ET
 import subprocess
 import os
 import sys
 from visualizer import (
     parse_config,
+    _parse_config_elements,
     parse_installed_packages,
     build_dependency_graph,
+    build_dependency_graphs,
     generate_plantuml,
     generate_image,
+    generate_images,
+    PlantUMLRunner,
     main
 )
 
+CONFIG_XML = """<config>
+    <PlantUMLPath>C:\\PlantUML\\plantuml.jar</PlantUMLPath>
+    <PackageName>bash</PackageName>
+    <OutputImagePath>C:\\Users\\Пользователь\\Desktop\\конфигурационка\\dependencies.png</OutputImagePath>
+    <PackageDatabasePath>C:\\Users\\Пользователь\\Desktop\\конфигурационка\\installed</PackageDatabasePath>
+</config>"""
+
+def iterparse_events(elem):
+    """
+    Формирует события start/end, которые iterparse выдал бы для дерева elem.
+    """
+    yield ('start', elem)
+    for child in elem:
+        yield from iterparse_events(child)
+    yield ('end', elem)
+
+class FakeFile:
+    """
+    Файл в памяти, содержимое которого хранится в FakeFileSystem.
+    """
+    def __init__(self, files, path):
+        self.files = files
+        self.path = path
+
+    def read(self):
+        return self.files[self.path]
+
+    def write(self, data):
+        self.files[self.path] += data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+class FakeFileSystem:
+    """
+    Подменяет builtins.open: хранит файлы в словаре и запоминает вызовы.
+    """
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+        self.calls = []
+
+    def __call__(self, path, mode='r', encoding=None):
+        self.calls.append((path, mode, encoding))
+        if 'w' in mode:
+            self.files[path] = b'' if 'b' in mode else ''
+        elif path not in self.files:
+            raise FileNotFoundError(2, 'No such file or directory', path)
+        return FakeFile(self.files, path)
+
+class FakeProcess:
+    """
+    Процесс PlantUML с вводом и выводом в памяти.
+    """
+    def __init__(self, output):
+        self.stdin = io.BytesIO()
+        self.stdout = io.BytesIO(output)
+        self.wait_calls = 0
+
+    def wait(self):
+        self.wait_calls += 1
+        return 0
+
+class FakeRunner:
+    """
+    Замена PlantUMLRunner, возвращающая заранее заданное изображение.
+    """
+    def __init__(self, image):
+        self.image = image
+        self.rendered = []
+
+    def render(self, plantuml_code):
+        self.rendered.append(plantuml_code)
+        return self.image
+
 class TestVisualizer(unittest.TestCase):
 
-    @patch('visualizer.ET.parse')
-    @patch('visualizer.os.path.isfile')
-    @patch('visualizer.os.path.exists')
-    def test_parse_config_success(self, mock_exists, mock_isfile, mock_parse):
-        # Настройка мока
-        mock_exists.return_value = True
-        mock_isfile.return_value = True
-        mock_tree = MagicMock()
-        mock_root = MagicMock()
-        mock_root.findtext.side_effect = [
-            'C:\\PlantUML\\plantuml.jar',
-            'bash',
-            'C:\\Users\\Пользователь\\Desktop\\конфигурационка\\dependencies.png',
-            'C:\\Users\\Пользователь\\Desktop\\конфигурационка\\installed'
-        ]
-        mock_tree.getroot.return_value = mock_root
-        mock_parse.return_value = mock_tree
+    @patch('visualizer.ET.iterparse')
+    @patch('visualizer.os.path.isfile', return_value=True)
+    @patch('visualizer.os.path.exists', return_value=True)
+    def test_parse_config_success(self, mock_exists, mock_isfile, mock_iterparse):
+        # Вместо чтения файла отдаем элементы XML, разобранного в памяти
+        mock_iterparse.return_value = iterparse_events(ET.fromstring(CONFIG_XML))
 
         # Вызов функции
-        result = parse_config('config.xml')
+        fake_open = FakeFileSystem({'config.xml': b''})
+        with patch('builtins.open', fake_open):
+            result = parse_config('config.xml')
 
         # Проверка результатов
         expected = (
@@ -43,59 +117,121 @@ class TestVisualizer(unittest.TestCase):
             'C:\\Users\\Пользователь\\Desktop\\конфигурационка\\installed'
         )
         self.assertEqual(result, expected)
-        mock_parse.assert_called_once_with('config.xml')
+        self.assertEqual(fake_open.calls, [('config.xml', 'rb', None)])
+        mock_iterparse.assert_called_once()
+        self.assertEqual(mock_iterparse.call_args.kwargs, {'events': ('start', 'end')})
 
-    @patch('visualizer.os.path.exists', return_value=False)
-    def test_parse_config_file_not_found(self, mock_exists):
+    @patch('visualizer.os.path.isfile', return_value=True)
+    @patch('visualizer.os.path.exists', return_value=True)
+    def test_parse_config_real_iterparse(self, mock_exists, mock_isfile):
+        # Настоящий iterparse читает XML из файла в памяти
+        config_file = io.BytesIO(CONFIG_XML.encode('utf-8'))
+        with patch('builtins.open', return_value=config_file):
+            result = parse_config('config.xml')
+
+        self.assertEqual(result[:2], ('C:\\PlantUML\\plantuml.jar', 'bash'))
+        self.assertEqual(result[3], 'C:\\Users\\Пользователь\\Desktop\\конфигурационка\\installed')
+        # Файл закрывается, хотя разбор остановился до конца документа
+        self.assertTrue(config_file.closed)
+
+    @patch('visualizer.ET.iterparse')
+    @patch('visualizer.os.path.isfile', return_value=True)
+    @patch('visualizer.os.path.exists', return_value=True)
+    def test_parse_config_reads_first_direct_child(self, mock_exists, mock_isfile, mock_iterparse):
+        # Вложенные теги игнорируются, из повторяющихся берется первый
+        root = ET.fromstring(CONFIG_XML.replace('</config>', (
+            '<PlantUMLPath>second.jar</PlantUMLPath>'
+            '<other><PackageName>nested</PackageName></other>'
+            '</config>'
+        )))
+        nested_root = ET.fromstring(CONFIG_XML.replace(
+            '<PackageName>bash</PackageName>',
+            '<other><PackageName>nested</PackageName></other><PackageName>bash</PackageName>'
+        ))
+        for tree in (root, nested_root):
+            mock_iterparse.return_value = iterparse_events(tree)
+            with patch('builtins.open', FakeFileSystem({'config.xml': b''})):
+                result = parse_config('config.xml')
+            self.assertEqual(result[:2], ('C:\\PlantUML\\plantuml.jar', 'bash'))
+
+    @patch('visualizer.ET.iterparse')
+    def test_parse_config_malformed_xml(self, mock_iterparse):
+        # iterparse сообщает об ошибке разбора только во время итерации
+        def broken_events():
+            raise ET.ParseError('syntax error')
+            yield
+
+        mock_iterparse.return_value = broken_events()
+        with patch('builtins.open', FakeFileSystem({'config.xml': b''})):
+            with self.assertRaises(ValueError) as context:
+                parse_config('config.xml')
+        self.assertIn("Ошибка парсинга XML-файла: syntax error", str(context.exception))
+
+    @patch('builtins.open', new_callable=FakeFileSystem)
+    def test_parse_config_file_not_found(self, mock_open):
         with self.assertRaises(FileNotFoundError) as context:
             parse_config('nonexistent_config.xml')
         self.assertIn("Конфигурационный файл не найден: nonexistent_config.xml", str(context.exception))
 
-    @patch('visualizer.ET.parse')
     @patch('visualizer.os.path.isfile', return_value=False)
     @patch('visualizer.os.path.exists', return_value=True)
-    def test_parse_config_plantuml_not_found(self, mock_exists, mock_isfile, mock_parse):
-        mock_tree = MagicMock()
-        mock_root = MagicMock()
-        mock_root.findtext.side_effect = [
-            'C:\\PlantUML\\plantuml_not_jar.exe',  # Не оканчивается на .jar
-            'bash',
-            'C:\\Users\\Пользователь\\Desktop\\конфигурационка\\dependencies.png',
-            'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\installed'
-        ]
-        mock_tree.getroot.return_value = mock_root
-        mock_parse.return_value = mock_tree
+    def test_parse_config_plantuml_not_found(self, mock_exists, mock_isfile):
+        root = ET.fromstring(CONFIG_XML.replace('plantuml.jar', 'plantuml_not_jar.exe'))  # Не оканчивается на .jar
 
         with self.assertRaises(FileNotFoundError) as context:
-            parse_config('config.xml')
+            _parse_config_elements(iter(root))
         self.assertIn("PlantUML не найден по пути: C:\\PlantUML\\plantuml_not_jar.exe", str(context.exception))
 
-    @patch('builtins.open', new_callable=mock_open, read_data="P:bash\nD:libc readline\nP:libc\nD:\nP:readline\nD:libc")
-    @patch('visualizer.os.path.exists', return_value=True)
-    def test_parse_installed_packages_success(self, mock_exists, mock_file):
-        result = parse_installed_packages('packages.db')
+    def test_parse_config_missing_field(self):
+        root = ET.fromstring(CONFIG_XML.replace('<PackageName>bash</PackageName>', ''))
+        with self.assertRaises(ValueError) as context:
+            _parse_config_elements(iter(root))
+        self.assertIn("Конфигурационный файл должен содержать", str(context.exception))
+
+    def test_parse_installed_packages_success(self):
+        fake_open = FakeFileSystem({'packages.db': "P:bash\nD:libc readline\nP:libc\nD:\nP:readline\nD:libc"})
+        with patch('builtins.open', fake_open):
+            result = parse_installed_packages('packages.db')
         expected = {
-            'bash': ['libc', 'readline'],
-            'libc': [],
-            'readline': ['libc']
+            'bash': ('libc', 'readline'),
+            'libc': (),
+            'readline': ('libc',)
         }
         self.assertEqual(result, expected)
-        mock_file.assert_called_once_with('packages.db', 'r', encoding='utf-8')
+        self.assertEqual(fake_open.calls, [('packages.db', 'r', 'utf-8')])
 
-    @patch('builtins.open', new_callable=mock_open, read_data="Invalid content")
-    @patch('visualizer.os.path.exists', return_value=True)
-    def test_parse_installed_packages_malformed(self, mock_exists, mock_file):
+    def test_parse_installed_packages_strips_whitespace(self):
+        # Пробельные символы по краям строк отбрасываются так же, как str.strip()
+        data = " \tP:bash \x0c\n\x0bD:libc\xa0readline\u2028\n  P:libc\x85\nD:"
+        with patch('builtins.open', FakeFileSystem({'packages.db': data})):
+            result = parse_installed_packages('packages.db')
+        expected = {
+            'bash': ('libc', 'readline'),
+            'libc': ()
+        }
+        self.assertEqual(result, expected)
+
+    def test_parse_installed_packages_malformed(self):
         # Функция пропускает некорректные строки и возвращает пустой словарь
-        result = parse_installed_packages('packages.db')
+        with patch('builtins.open', FakeFileSystem({'packages.db': "Invalid content"})):
+            result = parse_installed_packages('packages.db')
         expected = {}
         self.assertEqual(result, expected)
 
-    @patch('visualizer.os.path.exists', return_value=False)
-    def test_parse_installed_packages_file_not_found(self, mock_exists):
+    @patch('builtins.open', new_callable=FakeFileSystem)
+    def test_parse_installed_packages_file_not_found(self, fake_open):
         with self.assertRaises(FileNotFoundError) as context:
             parse_installed_packages('nonexistent_packages.db')
         self.assertIn("Файл базы данных пакетов не найден: nonexistent_packages.db", str(context.exception))
 
+    @patch('builtins.open', side_effect=PermissionError(13, 'Permission denied'))
+    def test_parse_installed_packages_permission_denied(self, mock_file):
+        # Отсутствие доступа не выдается за отсутствие файла
+        with self.assertRaises(IOError) as context:
+            parse_installed_packages('packages.db')
+        self.assertNotIsInstance(context.exception, FileNotFoundError)
+        self.assertIn("Ошибка чтения файла пакетов: [Errno 13] Permission denied", str(context.exception))
+
     def test_build_dependency_graph_success(self):
         packages_db = {
             'bash': ['libc', 'readline'],
@@ -110,6 +246,20 @@ class TestVisualizer(unittest.TestCase):
         result = build_dependency_graph('bash', packages_db)
         self.assertEqual(result, expected_graph)
 
+    def test_build_dependency_graph_missing_dependency(self):
+        # Зависимость, отсутствующая в базе, попадает в граф без зависимостей
+        packages_db = {
+            'bash': ('libc', 'readline'),
+            'readline': ('libc',)
+        }
+        expected_graph = {
+            'bash': ('libc', 'readline'),
+            'libc': (),
+            'readline': ('libc',)
+        }
+        result = build_dependency_graph('bash', packages_db)
+        self.assertEqual(result, expected_graph)
+
     def test_build_dependency_graph_nonexistent_package(self):
         packages_db = {
             'bash': ['libc'],
@@ -133,6 +283,82 @@ class TestVisualizer(unittest.TestCase):
         result = build_dependency_graph('A', packages_db)
         self.assertEqual(result, expected_graph)
 
+    def test_build_dependency_graph_strict_circular_dependency(self):
+        packages_db = {
+            'A': ['B'],
+            'B': ['C'],
+            'C': ['A']  # Циклическая зависимость
+        }
+        with self.assertRaises(ValueError) as context:
+            build_dependency_graph('A', packages_db, strict=True)
+        self.assertIn("Обнаружена циклическая зависимость: A -> B -> C -> A", str(context.exception))
+
+    def test_build_dependency_graph_strict_shared_dependency(self):
+        # Общая зависимость (ромб) не является циклом
+        packages_db = {
+            'bash': ['libc', 'readline'],
+            'libc': [],
+            'readline': ['libc']
+        }
+        result = build_dependency_graph('bash', packages_db, strict=True)
+        self.assertEqual(result, packages_db)
+
+    def test_build_dependency_graphs_success(self):
+        packages_db = {
+            'bash': ['libc', 'readline'],
+            'libc': [],
+            'readline': ['libc'],
+            'vim': ['readline', 'ncurses'],
+            'ncurses': ['libc']
+        }
+        result = build_dependency_graphs(['readline', 'vim', 'bash', 'readline'], packages_db)
+        self.assertEqual(list(result), ['readline', 'vim', 'bash'])
+        for package_name, graph in result.items():
+            self.assertEqual(graph, build_dependency_graph(package_name, packages_db))
+
+    def test_build_dependency_graphs_nonexistent_package(self):
+        packages_db = {
+            'bash': ['libc'],
+            'libc': []
+        }
+        with self.assertRaises(ValueError) as context:
+            build_dependency_graphs(['bash', 'nonexistent'], packages_db)
+        self.assertIn("Пакет 'nonexistent' не найден в базе данных пакетов.", str(context.exception))
+
+    def test_build_dependency_graphs_strict_cycle_through_known_graph(self):
+        # Граф 'B' уже построен, но из него есть путь обратно в 'A'
+        packages_db = {
+            'A': ['B'],
+            'B': ['C'],
+            'C': ['A']
+        }
+        with self.assertRaises(ValueError) as context:
+            build_dependency_graphs(['B', 'A'], packages_db, strict=True)
+        self.assertIn("Обнаружена циклическая зависимость: B -> C -> A -> B", str(context.exception))
+
+    def test_build_dependency_graphs_cycle_keeps_order(self):
+        # Готовые графы 'D' и 'B' ведут обратно в текущий путь, поэтому обходятся заново
+        packages_db = {
+            'A': ['E', 'B'],
+            'B': ['A', 'A', 'D'],
+            'C': [],
+            'D': ['A', 'E', 'E'],
+            'E': ['D', 'C']
+        }
+        result = build_dependency_graphs(['D', 'E', 'B'], packages_db)
+        for package_name, graph in result.items():
+            self.assertEqual(list(graph), list(build_dependency_graph(package_name, packages_db)))
+        self.assertEqual(list(result['E']), ['E', 'D', 'A', 'B', 'C'])
+
+    def test_build_dependency_graph_deep_chain(self):
+        # Длинная цепочка зависимостей не должна упираться в лимит рекурсии
+        depth = sys.getrecursionlimit() * 2
+        packages_db = {f'pkg{i}': [f'pkg{i + 1}'] for i in range(depth)}
+        packages_db[f'pkg{depth}'] = []
+        result = build_dependency_graph('pkg0', packages_db)
+        self.assertEqual(len(result), depth + 1)
+        self.assertEqual(list(result), [f'pkg{i}' for i in range(depth + 1)])
+
     def test_generate_plantuml(self):
         dependency_graph = {
             'bash': ['libc', 'readline'],
@@ -149,80 +375,41 @@ class TestVisualizer(unittest.TestCase):
         result = generate_plantuml(dependency_graph)
         self.assertEqual(result, expected_puml)
 
-    @patch('visualizer.os.remove')
-    @patch('builtins.print')
-    @patch('visualizer.tempfile.NamedTemporaryFile')
-    @patch('visualizer.os.rename')
-    @patch('visualizer.os.path.exists')
+    @patch('builtins.open', new_callable=FakeFileSystem)
     @patch('visualizer.subprocess.run')
-    def test_generate_image_success(self, mock_run, mock_exists, mock_rename, mock_tempfile, mock_print, mock_remove):
-        # Настройка мока временного файла
-        mock_tmp = MagicMock()
-        mock_tmp.name = 'C:\\Users\\73B5~1\\AppData\\Local\\Temp\\tmpjbs2s7jc.puml'
-        mock_named_tempfile = MagicMock()
-        mock_named_tempfile.__enter__.return_value = mock_tmp
-        mock_named_tempfile.__exit__.return_value = None
-        mock_tempfile.return_value = mock_named_tempfile
-
-        # Настройка мока subprocess.run
-        mock_run.return_value = subprocess.CompletedProcess(args=[], returncode=0, stdout=b'', stderr=b'')
-
-        # Настройка существования сгенерированного изображения
-        def exists_side_effect(path):
-            return path in [
-                'C:\\Users\\73B5~1\\AppData\\Local\\Temp\\tmpjbs2s7jc.puml',
-                'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\tmpjbs2s7jc.png'
-            ]
-
-        mock_exists.side_effect = exists_side_effect
+    def test_generate_image_success(self, mock_run, fake_open):
+        # Настройка мока subprocess.run: PlantUML возвращает PNG в stdout
+        mock_run.return_value = subprocess.CompletedProcess(args=[], returncode=0, stdout=b'\x89PNG image', stderr=b'')
 
         # Вызов функции
-        generate_image(
-            '@startuml\n"bash" --> "libc"\n"bash" --> "readline"\n"readline" --> "libc"\n@enduml',
-            'C:\\PlantUML\\plantuml.jar',
-            'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png'
-        )
+        with self.assertLogs('visualizer', level='DEBUG') as logs:
+            generate_image(
+                '@startuml\n"bash" --> "libc"\n"bash" --> "readline"\n"readline" --> "libc"\n@enduml',
+                'C:\\PlantUML\\plantuml.jar',
+                'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png'
+            )
 
         # Проверка вызовов
-        mock_tempfile.assert_called_once_with('w', delete=False, suffix='.puml')
         mock_run.assert_called_once_with(
             [
                 'java',
                 '-jar',
                 'C:\\PlantUML\\plantuml.jar',
-                '-tpng',
-                'C:\\Users\\73B5~1\\AppData\\Local\\Temp\\tmpjbs2s7jc.puml',
-                '-o',
-                'C:\\Users\\Пользователь\\Desktop\\конфигурационka'
+                '-pipe',
+                '-tpng'
             ],
+            input='@startuml\n"bash" --> "libc"\n"bash" --> "readline"\n"readline" --> "libc"\n@enduml'.encode('utf-8'),
             check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
-        expected_generated_image = 'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\tmpjbs2s7jc.png'
-        mock_rename.assert_called_once_with(expected_generated_image, 'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png')
-        mock_print.assert_called_with(f"Временный файл PlantUML создан: {mock_tmp.name}")
-        # Проверка удаления временного файла
-        mock_tmp.write.assert_called_once_with(
-            '@startuml\n"bash" --> "libc"\n"bash" --> "readline"\n"readline" --> "libc"\n@enduml'
-        )
-        mock_remove.assert_called_once_with(mock_tmp.name)
+        # Изображение записывается сразу в указанный файл
+        self.assertEqual(fake_open.files, {'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png': b'\x89PNG image'})
+        self.assertIn("Запуск PlantUML", logs.output[0])
 
-    @patch('visualizer.os.remove')
-    @patch('builtins.print')
-    @patch('visualizer.tempfile.NamedTemporaryFile')
-    @patch('visualizer.os.rename')
-    @patch('visualizer.os.path.exists', return_value=True)
+    @patch('builtins.open', new_callable=FakeFileSystem)
     @patch('visualizer.subprocess.run', side_effect=subprocess.CalledProcessError(1, 'cmd', stderr=b'Error'))
-    def test_generate_image_subprocess_error(self, mock_run, mock_exists, mock_rename, mock_tempfile, mock_print, mock_remove):
-        # Настройка мока временного файла
-        mock_tmp = MagicMock()
-        mock_tmp.name = 'temp.puml'
-        mock_named_tempfile = MagicMock()
-        mock_named_tempfile.__enter__.return_value = mock_tmp
-        mock_named_tempfile.__exit__.return_value = None
-        mock_tempfile.return_value = mock_named_tempfile
-
+    def test_generate_image_subprocess_error(self, mock_run, fake_open):
         # Вызов функции и проверка исключения
         with self.assertRaises(RuntimeError) as context:
             generate_image(
@@ -233,25 +420,150 @@ class TestVisualizer(unittest.TestCase):
         self.assertIn('Ошибка при выполнении PlantUML: Error', str(context.exception))
 
         # Проверка вызовов
+        mock_run.assert_called_once_with(
+            [
+                'java',
+                '-jar',
+                'C:\\PlantUML\\plantuml.jar',
+                '-pipe',
+                '-tpng'
+            ],
+            input=b'@startuml\n@enduml',
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        # При ошибке файл изображения не создается
+        self.assertEqual(fake_open.calls, [])
+
+    @patch('visualizer.shutil.rmtree')
+    @patch('visualizer.os.path.exists', return_value=True)
+    @patch('builtins.open', new_callable=FakeFileSystem)
+    @patch('visualizer.tempfile.mkdtemp', return_value=os.path.join('tmp', 'plantuml'))
+    @patch('visualizer.subprocess.run')
+    def test_generate_images_success(self, mock_run, mock_mkdtemp, fake_open, mock_exists, mock_rmtree):
+        mock_run.return_value = subprocess.CompletedProcess(args=[], returncode=0, stdout=b'', stderr=b'')
+        tmp_dir = os.path.join('tmp', 'plantuml')
+        output_dir = os.path.abspath(os.path.join('out', 'graphs'))
+
+        result = generate_images(
+            {'bash': '@startuml\n"bash" --> "libc"\n@enduml', 'libc': '@startuml\n@enduml'},
+            'C:\\PlantUML\\plantuml.jar',
+            os.path.join('out', 'graphs')
+        )
+
+        self.assertEqual(result, {
+            'bash': os.path.join(output_dir, 'bash.png'),
+            'libc': os.path.join(output_dir, 'libc.png')
+        })
+        # Все файлы .puml записываются во временный каталог
+        self.assertEqual(fake_open.files, {
+            os.path.join(tmp_dir, 'bash.puml'): '@startuml\n"bash" --> "libc"\n@enduml',
+            os.path.join(tmp_dir, 'libc.puml'): '@startuml\n@enduml'
+        })
+        self.assertEqual(fake_open.calls, [
+            (os.path.join(tmp_dir, 'bash.puml'), 'w', 'utf-8'),
+            (os.path.join(tmp_dir, 'libc.puml'), 'w', 'utf-8')
+        ])
+        # PlantUML запускается один раз для всего каталога
         mock_run.assert_called_once_with(
             [
                 'java',
                 '-jar',
                 'C:\\PlantUML\\plantuml.jar',
                 '-tpng',
-                'temp.puml',
+                '-charset',
+                'UTF-8',
                 '-o',
-                'C:\\Users\\Пользователь\\Desktop\\конфигурационka'
+                output_dir,
+                tmp_dir
             ],
             check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
-        mock_rename.assert_not_called()
-        mock_print.assert_called_with(f"Временный файл PlantUML создан: {mock_tmp.name}")
-        # Проверка удаления временного файла
-        mock_tmp.write.assert_called_once_with('@startuml\n@enduml')
-        mock_remove.assert_called_once_with(mock_tmp.name)
+        mock_rmtree.assert_called_once_with(tmp_dir, ignore_errors=True)
+
+    @patch('visualizer.shutil.rmtree')
+    @patch('builtins.open', new_callable=FakeFileSystem)
+    @patch('visualizer.tempfile.mkdtemp', return_value='tmpdir')
+    @patch('visualizer.subprocess.run', side_effect=subprocess.CalledProcessError(1, 'cmd', stderr=b'Error'))
+    def test_generate_images_subprocess_error(self, mock_run, mock_mkdtemp, fake_open, mock_rmtree):
+        with self.assertRaises(RuntimeError) as context:
+            generate_images({'bash': '@startuml\n@enduml'}, 'C:\\PlantUML\\plantuml.jar', 'out')
+        self.assertIn('Ошибка при выполнении PlantUML: Error', str(context.exception))
+        # Временный каталог удаляется и при ошибке
+        mock_rmtree.assert_called_once_with('tmpdir', ignore_errors=True)
+
+    @patch('visualizer.subprocess.Popen')
+    def test_plantuml_runner_render(self, mock_popen):
+        # PlantUML выводит каждое изображение и разделитель с переводом строки
+        delimiter = PlantUMLRunner.DELIMITER
+        fake_process = FakeProcess(b'\x89PNG first' + delimiter + b'\r\n\x89PNG second' + delimiter + b'\r\n')
+        mock_popen.return_value = fake_process
+
+        runner = PlantUMLRunner('C:\\PlantUML\\plantuml.jar')
+        self.assertEqual(runner.render('@startuml\n"a" --> "b"\n@enduml'), b'\x89PNG first')
+        self.assertEqual(runner.render('@startuml\n"c" --> "d"\n@enduml'), b'\x89PNG second')
+
+        mock_popen.assert_called_once_with(
+            [
+                'java',
+                '-jar',
+                'C:\\PlantUML\\plantuml.jar',
+                '-pipe',
+                '-tpng',
+                '-pipedelimitor',
+                delimiter.decode('ascii')
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        self.assertEqual(
+            fake_process.stdin.getvalue(),
+            b'@startuml\n"a" --> "b"\n@enduml\n@startuml\n"c" --> "d"\n@enduml\n'
+        )
+
+    @patch('visualizer.subprocess.Popen')
+    def test_plantuml_runner_process_exited(self, mock_popen):
+        fake_process = FakeProcess(b'')
+        mock_popen.return_value = fake_process
+
+        with PlantUMLRunner('C:\\PlantUML\\plantuml.jar') as runner:
+            with self.assertRaises(RuntimeError) as context:
+                runner.render('@startuml\n@enduml')
+        self.assertIn("PlantUML завершился, не вернув изображение.", str(context.exception))
+        self.assertEqual(fake_process.wait_calls, 1)
+        self.assertTrue(fake_process.stdin.closed)
+        self.assertTrue(fake_process.stdout.closed)
+
+    @patch('visualizer.subprocess.Popen')
+    def test_plantuml_runner_requires_enduml(self, mock_popen):
+        fake_process = FakeProcess(b'')
+        mock_popen.return_value = fake_process
+
+        runner = PlantUMLRunner('C:\\PlantUML\\plantuml.jar')
+        with self.assertRaises(ValueError) as context:
+            runner.render('@startuml\n"a" --> "b"')
+        self.assertIn("Код PlantUML должен содержать @enduml", str(context.exception))
+        # Незавершенная диаграмма не передается процессу
+        self.assertEqual(fake_process.stdin.getvalue(), b'')
+
+    @patch('visualizer.subprocess.run')
+    @patch('builtins.open', new_callable=FakeFileSystem)
+    def test_generate_image_with_runner(self, fake_open, mock_run):
+        fake_runner = FakeRunner(b'\x89PNG image')
+
+        generate_image(
+            '@startuml\n@enduml',
+            'C:\\PlantUML\\plantuml.jar',
+            'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png',
+            runner=fake_runner
+        )
+
+        self.assertEqual(fake_runner.rendered, ['@startuml\n@enduml'])
+        self.assertEqual(fake_open.files, {'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png': b'\x89PNG image'})
+        mock_run.assert_not_called()
 
     @patch('visualizer.sys.exit', side_effect=SystemExit(1))
     @patch('visualizer.parse_config')
@@ -259,8 +571,9 @@ class TestVisualizer(unittest.TestCase):
     @patch('visualizer.build_dependency_graph')
     @patch('visualizer.generate_plantuml')
     @patch('visualizer.generate_image')
+    @patch('visualizer.sys.stdout', new_callable=io.StringIO)
     @patch('builtins.print')
-    def test_main_success(self, mock_print, mock_generate_image, mock_generate_plantuml, mock_build_dependency_graph, mock_parse_installed_packages, mock_parse_config, mock_exit):
+    def test_main_success(self, mock_print, mock_stdout, mock_generate_image, mock_generate_plantuml, mock_build_dependency_graph, mock_parse_installed_packages, mock_parse_config, mock_exit):
         # Настройка мока parse_config
         mock_parse_config.return_value = (
             'C:\\PlantUML\\plantuml.jar',
@@ -318,13 +631,16 @@ class TestVisualizer(unittest.TestCase):
             'C:\\PlantUML\\plantuml.jar',
             'C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png'
         )
-        mock_print.assert_any_call("PlantUML Path: C:\\PlantUML\\plantuml.jar")
-        mock_print.assert_any_call("Package Name: bash")
-        mock_print.assert_any_call("Output Image Path: C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png")
-        mock_print.assert_any_call("Package Database Path: C:\\Users\\Пользователь\\Desktop\\конфигурационka\\installed")
-        mock_print.assert_any_call("Generated PlantUML Code:")
-        mock_print.assert_any_call('@startuml\n"bash" --> "libc"\n"bash" --> "readline"\n"readline" --> "libc"\n@enduml')
-        mock_print.assert_any_call("Граф зависимостей успешно сохранен в C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png")
+        self.assertEqual(mock_stdout.getvalue(), (
+            "PlantUML Path: C:\\PlantUML\\plantuml.jar\n"
+            "Package Name: bash\n"
+            "Output Image Path: C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png\n"
+            "Package Database Path: C:\\Users\\Пользователь\\Desktop\\конфигурационka\\installed\n"
+            "Generated PlantUML Code:\n"
+            '@startuml\n"bash" --> "libc"\n"bash" --> "readline"\n"readline" --> "libc"\n@enduml\n'
+            "Граф зависимостей успешно сохранен в C:\\Users\\Пользователь\\Desktop\\конфигурационka\\dependencies.png\n"
+        ))
+        mock_print.assert_not_called()
         mock_exit.assert_not_called()
 
     @patch('visualizer.sys.exit', side_effect=SystemExit(1))
@@ -351,8 +667,9 @@ class TestVisualizer(unittest.TestCase):
     @patch('visualizer.sys.exit', side_effect=SystemExit(1))
     @patch('visualizer.parse_installed_packages', side_effect=IOError('Read Error'))
     @patch('visualizer.parse_config')
+    @patch('visualizer.sys.stdout', new_callable=io.StringIO)
     @patch('builtins.print')
-    def test_main_parse_installed_packages_exception(self, mock_print, mock_parse_config, mock_parse_installed_packages, mock_exit):
+    def test_main_parse_installed_packages_exception(self, mock_print, mock_stdout, mock_parse_config, mock_parse_installed_packages, mock_exit):
         mock_parse_config.return_value = (
             'C:\\PlantUML\\plantuml.jar',
             'bash',
@@ -363,6 +680,8 @@ class TestVisualizer(unittest.TestCase):
         with patch.object(sys, 'argv', test_args):
             with self.assertRaises(SystemExit) as context:
                 main()
+        # Параметры конфигурации выводятся до ошибки
+        self.assertIn("Package Name: bash\n", mock_stdout.getvalue())
         mock_print.assert_called_with("Ошибка: Read Error")
         mock_exit.assert_called_once_with(1)
 
@@ -370,8 +689,9 @@ class TestVisualizer(unittest.TestCase):
     @patch('visualizer.build_dependency_graph', side_effect=ValueError('Dependency Error'))
     @patch('visualizer.parse_installed_packages')
     @patch('visualizer.parse_config')
+    @patch('visualizer.sys.stdout', new_callable=io.StringIO)
     @patch('builtins.print')
-    def test_main_build_dependency_graph_exception(self, mock_print, mock_parse_config, mock_parse_installed_packages, mock_build_dependency_graph, mock_exit):
+    def test_main_build_dependency_graph_exception(self, mock_print, mock_stdout, mock_parse_config, mock_parse_installed_packages, mock_build_dependency_graph, mock_exit):
         mock_parse_config.return_value = (
             'C:\\PlantUML\\plantuml.jar',
             'bash',
@@ -1,28 +1,72 @@
-import xml.etree.ElementTree as ET
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+import logging
 import os
+import re
+import shutil
 import sys
 import subprocess
 import tempfile
-from typing import Tuple, Dict, List
+from typing import Tuple, Dict, List, Iterable, Iterator, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Строка базы данных пакетов вида "P:<имя пакета>" или "D:<зависимости>"
+_PACKAGE_LINE_RE = re.compile(r'^[^\S\n]*([PD]):(.*?)[^\S\n]*$', re.MULTILINE)
 
 def parse_config(config_path: str) -> Tuple[str, str, str, str]:
     """
     Читает конфигурационный файл и возвращает путь к PlantUML,
     имя пакета, путь к выходному изображению и путь к базе данных пакетов.
     """
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"Конфигурационный файл не найден: {config_path}")
-
     try:
-        tree = ET.parse(config_path)
-    except ET.ParseError as e:
-        raise ValueError(f"Ошибка парсинга XML-файла: {e}")
+        config_file = open(config_path, 'rb')
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Конфигурационный файл не найден: {config_path}") from e
 
-    root = tree.getroot()
-    plantuml_path = root.findtext('PlantUMLPath')
-    package_name = root.findtext('PackageName')
-    output_image_path = root.findtext('OutputImagePath')
-    package_db_path = root.findtext('PackageDatabasePath')
+    # Файл открываем сами: iterparse не закрывает его, если чтение прервано досрочно
+    with config_file:
+        try:
+            # Потоково читаем XML: элементы отдаются по мере разбора файла
+            events = ET.iterparse(config_file, events=('start', 'end'))
+            return _parse_config_elements(_root_children(events))
+        except ET.ParseError as e:
+            raise ValueError(f"Ошибка парсинга XML-файла: {e}")
+
+def _root_children(events: Iterable[Tuple[str, ET.Element]]) -> Iterator[ET.Element]:
+    """
+    Отдает только прямых потомков корневого элемента по событиям start/end.
+    """
+    depth = 0
+    for event, elem in events:
+        if event == 'start':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                yield elem
+
+def _parse_config_elements(elements: Iterable[ET.Element]) -> Tuple[str, str, str, str]:
+    """
+    Извлекает параметры конфигурации из прямых потомков корневого элемента
+    и проверяет их корректность. Для повторяющегося тега берется первое значение.
+    """
+    wanted = {'PlantUMLPath', 'PackageName', 'OutputImagePath', 'PackageDatabasePath'}
+    found = {}
+    # Останавливаемся, как только найдены все нужные теги
+    for elem in elements:
+        if elem.tag in wanted and elem.tag not in found:
+            found[elem.tag] = elem.text
+            elem.clear()
+            if len(found) == len(wanted):
+                break
+
+    plantuml_path = found.get('PlantUMLPath')
+    package_name = found.get('PackageName')
+    output_image_path = found.get('OutputImagePath')
+    package_db_path = found.get('PackageDatabasePath')
 
     if not all([plantuml_path, package_name, output_image_path, package_db_path]):
         raise ValueError("Конфигурационный файл должен содержать PlantUMLPath, PackageName, OutputImagePath и PackageDatabasePath")
@@ -35,99 +79,222 @@ def parse_config(config_path: str) -> Tuple[str, str, str, str]:
 
     return plantuml_path, package_name, output_image_path, package_db_path
 
-def parse_installed_packages(package_file: str) -> Dict[str, List[str]]:
+def parse_installed_packages(package_file: str) -> Dict[str, Tuple[str, ...]]:
     """
     Парсит базу данных установленных пакетов и возвращает словарь,
-    где ключ — имя пакета, а значение — список его зависимостей.
+    где ключ — имя пакета, а значение — кортеж его зависимостей.
     """
-    if not os.path.exists(package_file):
-        raise FileNotFoundError(f"Файл базы данных пакетов не найден: {package_file}")
-
+    # Зависимости хранятся в кортежах: пустые разделяют один объект ()
     packages_db = {}
     current_package = None
     dependencies = []
 
     try:
         with open(package_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith('P:'):
-                    if current_package:
-                        packages_db[current_package] = dependencies
-                    current_package = line[2:]
-                    dependencies = []
-                elif line.startswith('D:'):
-                    dep_line = line[2:]
-                    deps = dep_line.split()
-                    dependencies.extend(deps)
-            if current_package:
-                packages_db[current_package] = dependencies
+            data = f.read()
+        # Нужные строки находит одно регулярное выражение, остальные пропускаются
+        for kind, value in _PACKAGE_LINE_RE.findall(data):
+            if kind == 'P':
+                if current_package:
+                    packages_db[current_package] = tuple(dependencies)
+                current_package = value
+                dependencies = []
+            else:
+                dependencies.extend(value.split())
+        if current_package:
+            packages_db[current_package] = tuple(dependencies)
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Файл базы данных пакетов не найден: {package_file}") from e
     except Exception as e:
         raise IOError(f"Ошибка чтения файла пакетов: {e}")
 
     return packages_db
 
-def build_dependency_graph(package_name: str, packages_db: Dict[str, List[str]]) -> Dict[str, List[str]]:
+# Состояния вершин при обходе в глубину
+_WHITE, _GRAY, _BLACK = 0, 1, 2
+
+def build_dependency_graph(package_name: str, packages_db: Dict[str, Sequence[str]], strict: bool = False) -> Dict[str, Sequence[str]]:
     """
     Строит граф зависимостей для заданного пакета, включая транзитивные зависимости.
+    Если strict=True, при обнаружении циклической зависимости выбрасывается ValueError.
+    """
+    return _walk_dependencies(package_name, packages_db, strict, {})
+
+def build_dependency_graphs(package_names: List[str], packages_db: Dict[str, Sequence[str]], strict: bool = False) -> Dict[str, Dict[str, Sequence[str]]]:
+    """
+    Строит графы зависимостей для нескольких пакетов из одной базы данных.
+    Уже построенные графы переиспользуются: если обход доходит до пакета,
+    для которого граф известен, его вершины добавляются без повторного обхода.
+    """
+    graphs = {}
+    for package_name in package_names:
+        if package_name not in graphs:
+            graphs[package_name] = _walk_dependencies(package_name, packages_db, strict, graphs)
+    return graphs
+
+def _walk_dependencies(package_name: str, packages_db: Dict[str, Sequence[str]], strict: bool,
+                       known_graphs: Dict[str, Dict[str, Sequence[str]]]) -> Dict[str, Sequence[str]]:
+    """
+    Обходит зависимости пакета в глубину, используя готовые графы из known_graphs.
     """
     if package_name not in packages_db:
         raise ValueError(f"Пакет '{package_name}' не найден в базе данных пакетов.")
 
-    dependency_graph = {}
-    visited = set()
+    # color хранит вершины в порядке обнаружения, граф строится по нему после обхода
+    color = {}
+    path = []
+    stack = [(package_name, False)]
 
-    def visit(pkg: str):
-        if pkg not in visited:
-            visited.add(pkg)
-            deps = packages_db.get(pkg, [])
-            dependency_graph[pkg] = deps
-            for dep in deps:
-                visit(dep)
+    # Обход в глубину с явным стеком вместо рекурсии.
+    # Серые вершины образуют текущий путь, поэтому переход в серую вершину — цикл.
+    while stack:
+        pkg, leaving = stack.pop()
+        if leaving:
+            color[pkg] = _BLACK
+            path.pop()
+            continue
+        state = color.get(pkg, _WHITE)
+        if state == _GRAY:
+            if strict:
+                cycle = path[path.index(pkg):] + [pkg]
+                raise ValueError(f"Обнаружена циклическая зависимость: {' -> '.join(cycle)}")
+            continue
+        if state == _BLACK:
+            continue
+        known = known_graphs.get(pkg)
+        # Готовый граф, ведущий обратно в текущий путь, обходим заново: иначе в строгом
+        # режиме цикл не будет найден, а в обычном изменится порядок вершин
+        if known is not None and not any(p in known for p in path):
+            for dep_pkg in known:
+                if dep_pkg not in color:
+                    color[dep_pkg] = _BLACK
+            continue
+        color[pkg] = _GRAY
+        path.append(pkg)
+        deps = packages_db[pkg] if pkg in packages_db else ()
+        stack.append((pkg, True))
+        # Кладем зависимости в обратном порядке, чтобы обходить их в исходном
+        stack.extend((dep, False) for dep in reversed(deps))
 
-    visit(package_name)
-    return dependency_graph
+    return {pkg: packages_db[pkg] if pkg in packages_db else () for pkg in color}
 
-def generate_plantuml(dependency_graph: Dict[str, List[str]]) -> str:
+def generate_plantuml(dependency_graph: Dict[str, Sequence[str]]) -> str:
     """
     Генерирует код PlantUML на основе графа зависимостей.
     """
-    lines = ['@startuml']
-    for pkg, deps in dependency_graph.items():
-        for dep in deps:
-            lines.append(f'"{pkg}" --> "{dep}"')
-    lines.append('@enduml')
-    return '\n'.join(lines)
+    edges = [f'"{pkg}" --> "{dep}"' for pkg, deps in dependency_graph.items() for dep in deps]
+    return '\n'.join(['@startuml', *edges, '@enduml'])
 
-def generate_image(plantuml_code: str, plantuml_path: str, output_image_path: str) -> None:
+class PlantUMLRunner:
+    """
+    Держит запущенный процесс PlantUML в режиме -pipe, чтобы генерировать
+    несколько изображений без повторного запуска JVM.
+    """
+    # Разделитель, который PlantUML выводит после каждого изображения
+    DELIMITER = b'--visualizer-end-of-image--'
+
+    def __init__(self, plantuml_path: str):
+        command = ['java', '-jar', plantuml_path, '-pipe', '-tpng', '-pipedelimitor', self.DELIMITER.decode('ascii')]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._buffer = b''
+
+    def render(self, plantuml_code: str) -> bytes:
+        """
+        Передает код PlantUML процессу и возвращает PNG-изображение.
+        Код должен заканчиваться @enduml: иначе PlantUML ждет продолжения диаграммы
+        и не выводит изображение.
+        """
+        if '@enduml' not in plantuml_code:
+            raise ValueError("Код PlantUML должен содержать @enduml")
+
+        try:
+            self._process.stdin.write(plantuml_code.encode('utf-8') + b'\n')
+            self._process.stdin.flush()
+        except OSError as e:
+            raise RuntimeError(f"Ошибка при выполнении PlantUML: {e}")
+
+        # Читаем вывод, пока не встретится разделитель
+        while self.DELIMITER not in self._buffer:
+            chunk = self._process.stdout.read1(65536)
+            if not chunk:
+                raise RuntimeError("PlantUML завершился, не вернув изображение.")
+            self._buffer += chunk
+
+        image, _, self._buffer = self._buffer.partition(self.DELIMITER)
+        # Отбрасываем перевод строки, оставшийся после предыдущего разделителя
+        return image.lstrip(b'\r\n')
+
+    def close(self) -> None:
+        """
+        Закрывает каналы PlantUML и дожидается завершения процесса.
+        """
+        if self._process.stdin:
+            self._process.stdin.close()
+        self._process.wait()
+        if self._process.stdout:
+            self._process.stdout.close()
+
+    def __enter__(self) -> 'PlantUMLRunner':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+def generate_image(plantuml_code: str, plantuml_path: str, output_image_path: str,
+                   runner: Optional[PlantUMLRunner] = None) -> None:
     """
     Использует PlantUML для генерации PNG-изображения графа зависимостей.
+    Если передан runner, изображение генерируется уже запущенным процессом PlantUML.
     """
-    with tempfile.NamedTemporaryFile('w', delete=False, suffix='.puml') as tmp:
-        tmp.write(plantuml_code)
-        tmp_path = tmp.name
-        print(f"Временный файл PlantUML создан: {tmp_path}")
+    if runner is not None:
+        image = runner.render(plantuml_code)
+    else:
+        # PlantUML запускается через java -jar plantuml.jar и в режиме -pipe
+        # читает код из stdin, а PNG-изображение пишет в stdout
+        command = ['java', '-jar', plantuml_path, '-pipe', '-tpng']
+        logger.debug("Запуск PlantUML: %s", command)
+        try:
+            result = subprocess.run(command, input=plantuml_code.encode('utf-8'), check=True,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError as e:
+            stderr = e.stderr.decode().strip()
+            raise RuntimeError(f"Ошибка при выполнении PlantUML: {stderr}")
+        image = result.stdout
+
+    with open(output_image_path, 'wb') as f:
+        f.write(image)
 
+def generate_images(plantuml_codes: Dict[str, str], plantuml_path: str, output_dir: str) -> Dict[str, str]:
+    """
+    Генерирует PNG-изображения для нескольких графов одним запуском PlantUML.
+    Возвращает словарь, где ключ — имя графа, а значение — абсолютный путь к изображению.
+    """
+    # Каталог вывода вычисляется один раз: он нужен и PlantUML, и для путей к изображениям
+    output_dir = os.path.abspath(output_dir)
+    tmp_dir = tempfile.mkdtemp()
     try:
-        # Команда для запуска PlantUML
-        # PlantUML запускается через java -jar plantuml.jar
-        command = ['java', '-jar', plantuml_path, '-tpng', tmp_path, '-o', os.path.dirname(output_image_path)]
-        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Определяем путь к сгенерированному изображению в директории вывода
-        generated_image = os.path.join(os.path.dirname(output_image_path), os.path.splitext(os.path.basename(tmp_path))[0] + '.png')
-
-        if not os.path.exists(generated_image):
-            raise FileNotFoundError("PlantUML не сгенерировал изображение.")
-
-        # Перемещаем сгенерированное изображение в желаемое место (переименовываем)
-        os.rename(generated_image, output_image_path)
-    except subprocess.CalledProcessError as e:
-        stderr = e.stderr.decode().strip()
-        raise RuntimeError(f"Ошибка при выполнении PlantUML: {stderr}")
+        for name, plantuml_code in plantuml_codes.items():
+            with open(os.path.join(tmp_dir, name + '.puml'), 'w', encoding='utf-8') as f:
+                f.write(plantuml_code)
+
+        # PlantUML обрабатывает все файлы каталога за один запуск JVM
+        command = ['java', '-jar', plantuml_path, '-tpng', '-charset', 'UTF-8', '-o', output_dir, tmp_dir]
+        logger.debug("Запуск PlantUML: %s", command)
+        try:
+            subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError as e:
+            stderr = e.stderr.decode().strip()
+            raise RuntimeError(f"Ошибка при выполнении PlantUML: {stderr}")
     finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    images = {}
+    for name in plantuml_codes:
+        image_path = os.path.join(output_dir, name + '.png')
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"PlantUML не сгенерировал изображение: {image_path}")
+        images[name] = image_path
+    return images
 
 def main():
     if len(sys.argv) != 2:
@@ -136,18 +303,20 @@ def main():
     config_path = sys.argv[1]
     try:
         plantuml_path, package_name, output_image_path, package_db_path = parse_config(config_path)
-        print(f"PlantUML Path: {plantuml_path}")
-        print(f"Package Name: {package_name}")
-        print(f"Output Image Path: {output_image_path}")
-        print(f"Package Database Path: {package_db_path}")
+        # Каждый блок вывода записывается одним вызовом, а не построчно
+        sys.stdout.write(
+            f"PlantUML Path: {plantuml_path}\n"
+            f"Package Name: {package_name}\n"
+            f"Output Image Path: {output_image_path}\n"
+            f"Package Database Path: {package_db_path}\n"
+        )
 
         packages_db = parse_installed_packages(package_db_path)
         dependency_graph = build_dependency_graph(package_name, packages_db)
         plantuml_code = generate_plantuml(dependency_graph)
-        print("Generated PlantUML Code:")
-        print(plantuml_code)
+        sys.stdout.write(f"Generated PlantUML Code:\n{plantuml_code}\n")
         generate_image(plantuml_code, plantuml_path, output_image_path)
-        print(f"Граф зависимостей успешно сохранен в {output_image_path}")
+        sys.stdout.write(f"Граф зависимостей успешно сохранен в {output_image_path}\n")
     except Exception as e:
         print(f"Ошибка: {e}")
         sys.exit(1)